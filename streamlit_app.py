@@ -1,75 +1,23 @@
 import streamlit as st
 import pandas as pd
+import polars as pl
 import nfl_data_py as nfl
-from datetime import datetime
-from functools import reduce
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
 import plotly.express as px
-import pytz # Import the new timezone library
 
 # --- Configuration ---
 st.set_page_config(page_title="NFL Stats Explorer", layout="wide")
 
-# --- Data Loading and Caching ---
-@st.cache_data(ttl=60 * 60 * 12)
-def load_weekly_and_ngs_data(year):
-    """Loads and caches the standard weekly and NGS data for offensive stats."""
-    weekly_df = nfl.import_weekly_data(years=[year])
-    ngs_data = {}
-    for stat_type in ['passing', 'rushing', 'receiving']:
-        ngs_data[stat_type] = nfl.import_ngs_data(stat_type=stat_type, years=[year])
-    return weekly_df, ngs_data
-
-@st.cache_data(ttl=60 * 60 * 12)
-def load_and_aggregate_pbp_data(year):
-    """
-    Loads and caches Play-by-Play data for a given year and aggregates it
-    to create a clean, accurate defensive stats dataframe.
-    """
-    # More robust PBP data loading
-    pbp_df = nfl.import_pbp_data(years=[year], downcast=True, cache=False)
-    rosters_df = nfl.import_seasonal_rosters(years=[year])
-    
-    def_stats_dict = {
-        'sacks': ('sack', 'sack_player_name'),
-        'interceptions': ('interception', 'interception_player_name'),
-        'fumbles_forced': ('fumble_forced', 'forced_fumble_player_1_player_name'),
-        'passes_defended': ('pass_defense_1_player_name', 'pass_defense_1_player_name'),
-        'fumbles_recovered': ('fumble', 'fumble_recovery_1_player_name')
-    }
-
-    aggregated_stats = []
-    for stat_name, (flag_col, player_col) in def_stats_dict.items():
-        if player_col in pbp_df.columns:
-            df_filtered = pbp_df.dropna(subset=[player_col])
-            
-            if stat_name in ['passes_defended', 'fumbles_recovered']:
-                stat_df = df_filtered.groupby(player_col).size().reset_index(name=stat_name)
-            else:
-                stat_df = df_filtered[df_filtered[flag_col] == 1].groupby(player_col)[flag_col].sum().reset_index()
-            
-            stat_df = stat_df.rename(columns={flag_col: stat_name, player_col: 'player_display_name'})
-            aggregated_stats.append(stat_df)
-
-    if not aggregated_stats: return pd.DataFrame()
-
-    defensive_df = reduce(lambda left, right: pd.merge(left, right, on='player_display_name', how='outer'), aggregated_stats)
-    defensive_df = defensive_df.fillna(0)
-
-    stat_cols_to_convert = [stat for stat in def_stats_dict.keys() if stat in defensive_df.columns]
-    defensive_df[stat_cols_to_convert] = defensive_df[stat_cols_to_convert].astype(int)
-
-    player_positions = rosters_df[['player_name', 'position']].rename(columns={'player_name': 'player_display_name'})
-    player_positions = player_positions.drop_duplicates(subset=['player_display_name'])
-    
-    final_def_df = pd.merge(defensive_df, player_positions, on='player_display_name', how='left')
-    return final_def_df
-
 # --- Stat Dictionaries ---
 OFFENSE_STATS = {
     'Passing Yards': 'passing_yards', 'Passing TDs': 'passing_tds', 'Interceptions Thrown': 'interceptions', 
     'Sacks Taken': 'sacks', 'Rushing Yards': 'rushing_yards', 'Rushing TDs': 'rushing_tds',
     'Receptions': 'receptions', 'Receiving Yards': 'receiving_yards', 'Receiving TDs': 'receiving_tds'
 }
+OFFENSE_STAT_COLUMNS = pd.Index(OFFENSE_STATS.values())
+OFFENSE_STAT_LABELS = pd.Series(list(OFFENSE_STATS.keys()), index=OFFENSE_STAT_COLUMNS)
 DEFENSE_STATS = {
     'Sacks': 'sacks', 'Interceptions': 'interceptions', 'Passes Defended': 'passes_defended',
     'Forced Fumbles': 'fumbles_forced', 'Fumbles Recovered': 'fumbles_recovered'
@@ -85,15 +33,175 @@ COLUMN_RENAME_MAP = {
     **{v: k for k, v in OFFENSE_STATS.items()},
     **{v: k for k, v in DEFENSE_STATS.items()}
 }
+# Fixed leading column labels of the leaderboards; the stat's display label is appended
+LEADER_LABELS = ['Player', 'Pos']
+NGS_LEADER_LABELS = ['Player']
+
+# --- Data Loading and Caching ---
+# Maps each defensive stat to its (flag column, player column) in the PBP data
+DEF_STAT_SOURCES = {
+    'sacks': ('sack', 'sack_player_name'),
+    'interceptions': ('interception', 'interception_player_name'),
+    'fumbles_forced': ('fumble_forced', 'forced_fumble_player_1_player_name'),
+    'passes_defended': ('pass_defense_1_player_name', 'pass_defense_1_player_name'),
+    'fumbles_recovered': ('fumble', 'fumble_recovery_1_player_name')
+}
+
+def to_arrow_backed(df, string_cols, category_cols=()):
+    """Stores text columns as Arrow-backed strings and low-cardinality labels as categoricals."""
+    dtypes = {col: 'string[pyarrow]' for col in string_cols if col in df.columns}
+    dtypes.update({col: 'category' for col in category_cols if col in df.columns})
+    return df.astype(dtypes)
+
+def fetch_weekly_and_ngs_data(year):
+    """Downloads the standard weekly and NGS data for offensive stats."""
+    weekly_df = nfl.import_weekly_data(years=[year])
+    weekly_df = to_arrow_backed(weekly_df, ['player_display_name', 'position'], ['season_type'])
+    ngs_types = ['passing', 'rushing', 'receiving']
+    # The NGS fetches are network-bound, so issue them concurrently
+    with ThreadPoolExecutor(max_workers=len(ngs_types)) as executor:
+        ngs_frames = executor.map(lambda stat_type: nfl.import_ngs_data(stat_type=stat_type, years=[year]), ngs_types)
+        ngs_data = {}
+        for stat_type, ngs_df in zip(ngs_types, ngs_frames):
+            ngs_df = ngs_df[ngs_df['season'] == year]
+            ngs_data[stat_type] = to_arrow_backed(ngs_df, ['player_display_name', 'player_position'], ['season_type'])
+    return weekly_df, ngs_data
+
+def is_completed_season(year):
+    """A season is final once its postseason is over (the Super Bowl is played in February)."""
+    return datetime.now() >= datetime(year + 1, 3, 1)
+
+@st.cache_data(ttl=60 * 60 * 12)
+def load_current_weekly_and_ngs_data(year):
+    """Caches the in-progress season's weekly and NGS data, refreshed like the PBP data."""
+    return fetch_weekly_and_ngs_data(year)
+
+# Completed seasons no longer change, so they are persisted to disk and survive
+# worker restarts. Streamlit ignores ttl on disk-persisted caches.
+@st.cache_data(persist="disk")
+def load_completed_weekly_and_ngs_data(year):
+    """Caches a completed season's weekly and NGS data on disk."""
+    return fetch_weekly_and_ngs_data(year)
+
+def load_weekly_and_ngs_data(year):
+    """Loads the standard weekly and NGS data for offensive stats from the matching cache."""
+    if is_completed_season(year):
+        return load_completed_weekly_and_ngs_data(year)
+    return load_current_weekly_and_ngs_data(year)
+
+SEASON_TYPE_CODES = {'Regular Season': 'REG', 'Postseason': 'POST'}
+
+def filter_season_type(df, season_type):
+    """Restricts a dataframe with a season_type column to the selected season type ('All' keeps every game)."""
+    season_code = SEASON_TYPE_CODES.get(season_type)
+    return df if season_code is None else df[df['season_type'] == season_code]
+
+@st.cache_data(ttl=60 * 60 * 12)
+def season_offense_sums(year, season_type):
+    """
+    Sums every offensive stat per player, position and week once per season type,
+    so the Top Performers leaderboards only re-aggregate this small frame.
+    """
+    weekly_df, _ = load_weekly_and_ngs_data(year)
+    weekly_df = filter_season_type(weekly_df, season_type)
+    stat_cols = OFFENSE_STAT_COLUMNS.intersection(weekly_df.columns, sort=False)
+    return weekly_df.groupby(['player_display_name', 'position', 'week'], sort=False, observed=True, as_index=False)[stat_cols].sum()
+
+@st.cache_resource(ttl=60 * 60 * 12)
+def player_weekly_index(year, season_type):
+    """
+    Indexes the season-filtered weekly week and offense stat columns by player
+    name (stable sort, so each player's weeks keep their order) for fast Player
+    Search lookups. Cached as a shared resource so reruns reuse the same index;
+    callers must treat it as read-only.
+    """
+    weekly_df, _ = load_weekly_and_ngs_data(year)
+    weekly_df = filter_season_type(weekly_df, season_type)
+    lookup_cols = ['player_display_name', 'week', *OFFENSE_STAT_COLUMNS.intersection(weekly_df.columns, sort=False)]
+    return weekly_df[lookup_cols].set_index('player_display_name').sort_index(kind='stable')
+
+@st.cache_data(ttl=60 * 60 * 12)
+def get_player_universe(year, season_type):
+    """Returns the sorted player names for the Player Search dropdown as a tuple."""
+    # Built from the lookup index so every listed player can be found in it
+    return tuple(player_weekly_index(year, season_type).index.unique())
+
+@st.cache_resource(ttl=60 * 60 * 12)
+def load_raw_pbp_data(year):
+    """
+    Loads the Play-by-Play data for a given year, projected down to the columns
+    the defensive aggregation reads. Cached as a shared resource so the large
+    frame is never hashed or pickled; callers must treat it as read-only.
+    """
+    # More robust PBP data loading
+    pbp_df = nfl.import_pbp_data(years=[year], downcast=True, cache=False)
+    # Keep only the handful of columns the aggregation reads out of the ~400 PBP columns
+    needed_cols = {'season_type'} | {col for cols in DEF_STAT_SOURCES.values() for col in cols}
+    pbp_df = pbp_df[[col for col in pbp_df.columns if col in needed_cols]]
+    # Categorical player names let the aggregation group on integer codes instead of strings
+    category_cols = {'season_type'} | {player_col for _, player_col in DEF_STAT_SOURCES.values()}
+    return pbp_df.astype({col: 'category' for col in category_cols if col in pbp_df.columns})
+
+@st.cache_data(ttl=60 * 60 * 12)
+def load_and_aggregate_pbp_data(year):
+    """
+    Aggregates the cached Play-by-Play data for a given year into a clean,
+    accurate long-form defensive stats dataframe with one row per player,
+    season type and stat, so a single cache entry serves every season type.
+    """
+    pbp_df = load_raw_pbp_data(year)
+    rosters_df = nfl.import_seasonal_rosters(years=[year])
+
+    pldf = pl.from_pandas(pbp_df)
+    stat_frames = []
+    for stat_name, (flag_col, player_col) in DEF_STAT_SOURCES.items():
+        if player_col in pldf.columns:
+            condition = pl.col(player_col).is_not_null()
+            if stat_name not in ['passes_defended', 'fumbles_recovered']:
+                condition = condition & (pl.col(flag_col) == 1)
+            stat_frames.append(
+                pldf.filter(condition).select(
+                    pl.col(player_col).alias('player_display_name'), pl.col('season_type'), pl.lit(stat_name).alias('stat')
+                )
+            )
+
+    if not stat_frames: return pd.DataFrame()
+
+    # Every stacked row is one credited play, so each stat is a count within a single group_by.
+    # Season totals stay far below int16's range, which keeps the cached frame compact.
+    defensive_df = (
+        pl.concat(stat_frames)
+        .group_by(['player_display_name', 'season_type', 'stat'])
+        .agg(pl.len().cast(pl.Int16).alias('value'))
+        .to_pandas()
+    )
+
+    # Look up each player's roster position through an aligned index rather than a merge
+    player_positions = rosters_df.drop_duplicates(subset=['player_name']).set_index('player_name')['position']
+    defensive_df['position'] = defensive_df['player_display_name'].map(player_positions)
+    return to_arrow_backed(defensive_df, ['player_display_name', 'position', 'stat'], ['season_type'])
+
+@st.cache_data(ttl=60 * 60 * 12)
+def season_defense_stats(year, season_type):
+    """Pivots the long-form defensive stats into one row per player for the selected season type."""
+    defensive_long_df = load_and_aggregate_pbp_data(year)
+    if defensive_long_df.empty: return defensive_long_df
+    defensive_long_df = filter_season_type(defensive_long_df, season_type)
+    defensive_df = (
+        defensive_long_df.groupby(['player_display_name', 'position', 'stat'], sort=False, observed=True, dropna=False)['value'].sum()
+        .unstack('stat', fill_value=0)
+        .astype('int16')
+    )
+    return defensive_df.reset_index().rename_axis(columns=None)
 
 # --- UI and Logic ---
 st.title("🏈 NFL Stats Explorer")
 
 # --- Timezone Corrected Refresh Button ---
+EASTERN_TZ = ZoneInfo('America/New_York')
+
 def get_eastern_time():
-    utc_now = datetime.now(pytz.utc)
-    eastern = pytz.timezone('US/Eastern')
-    return utc_now.astimezone(eastern).strftime("%B %d, %Y at %I:%M %p %Z")
+    return datetime.now(timezone.utc).astimezone(EASTERN_TZ).strftime("%B %d, %Y at %I:%M %p %Z")
 
 if 'last_refresh' not in st.session_state:
     st.session_state['last_refresh'] = get_eastern_time()
@@ -104,6 +212,7 @@ with col1:
 with col2:
     if st.button("🔄 Refresh Data"):
         st.cache_data.clear()
+        st.cache_resource.clear()
         st.session_state['last_refresh'] = get_eastern_time()
         st.rerun()
 
@@ -112,22 +221,13 @@ selected_year = st.sidebar.selectbox("Select Season", [2025, 2024, 2023, 2022],
 season_type_toggle = st.sidebar.radio("Select Season Type", ('All', 'Regular Season', 'Postseason'))
 
 weekly_df_raw, ngs_data_raw = load_weekly_and_ngs_data(selected_year)
-defensive_df_raw = load_and_aggregate_pbp_data(selected_year)
-
-if season_type_toggle == 'Regular Season':
-    weekly_df = weekly_df_raw[weekly_df_raw['season_type'] == 'REG'].copy()
-elif season_type_toggle == 'Postseason':
-    weekly_df = weekly_df_raw[weekly_df_raw['season_type'] == 'POST'].copy()
-else:
-    weekly_df = weekly_df_raw.copy()
-
-defensive_df = defensive_df_raw
+weekly_df = filter_season_type(weekly_df_raw, season_type_toggle)
 
 if weekly_df.empty:
     st.warning(f"No offensive data available for {selected_year} {season_type_toggle}.")
     st.stop()
 
-all_players = sorted(weekly_df['player_display_name'].unique())
+all_players = get_player_universe(selected_year, season_type_toggle)
 tab1, tab2 = st.tabs(["🏆 Top Performers", "🔍 Player Search"])
 
 # (The rest of the app logic remains the same)
@@ -140,17 +240,17 @@ with tab1:
     chart_title = ""
 
     if main_category == "Defense":
-        st.info("Defensive stats are aggregated from season-long Play-by-Play data and include both regular and post-season.")
+        st.info(f"Defensive stats are aggregated from Play-by-Play data ({season_type_toggle}).")
         sub_category_key = st.selectbox("Select Defense Stat", list(DEFENSE_STATS.keys()))
         stat_column = DEFENSE_STATS[sub_category_key]
+        defensive_df = season_defense_stats(selected_year, season_type_toggle)
         
         if stat_column in defensive_df.columns:
-            leaderboard = defensive_df.sort_values(by=stat_column, ascending=False)
-            leaderboard = leaderboard[leaderboard[stat_column] > 0].head(20)
+            leaderboard = defensive_df[defensive_df[stat_column] > 0].nlargest(20, stat_column)
             display_cols = ['player_display_name', 'position', stat_column]
             leaderboard = leaderboard[display_cols].reset_index(drop=True)
             leaderboard.index = leaderboard.index + 1
-            st.dataframe(leaderboard.rename(columns=COLUMN_RENAME_MAP))
+            st.dataframe(leaderboard.set_axis([*LEADER_LABELS, sub_category_key], axis=1))
             chart_df = leaderboard
             chart_stat_col = stat_column
             chart_title = f"Top 20 Leaders: {sub_category_key}"
@@ -159,30 +259,31 @@ with tab1:
         st.header(f"Top Performers - {selected_year} {season_type_toggle}")
         min_week, max_week = int(weekly_df['week'].min()), int(weekly_df['week'].max())
         week_range = st.slider("Select Week Range", min_week, max_week, (min_week, max_week), key="main_slider")
-        df_for_leaders = weekly_df[(weekly_df['week'] >= week_range[0]) & (weekly_df['week'] <= week_range[1])]
         
         if main_category == "Offense":
             sub_category_key = st.selectbox("Select Offense Stat", list(OFFENSE_STATS.keys()))
             stat_column = OFFENSE_STATS[sub_category_key]
+            offense_sums = season_offense_sums(selected_year, season_type_toggle)
+            df_for_leaders = offense_sums[(offense_sums['week'] >= week_range[0]) & (offense_sums['week'] <= week_range[1])]
             display_cols = ['player_display_name', 'position', stat_column]
             groupby_cols = ['player_display_name', 'position']
+            leader_labels = LEADER_LABELS
         
         else:
             ngs_type = st.selectbox("Select NGS Category", ["Passing", "Rushing", "Receiving"])
             df_for_leaders = ngs_data_raw[ngs_type.lower()]
-            df_for_leaders = df_for_leaders[df_for_leaders['season'] == selected_year]
             ngs_stat_cols = {NGS_TRANSLATIONS.get(col, col): col for col in df_for_leaders.columns if col in NGS_TRANSLATIONS}
             sub_category_key = st.selectbox("Select Next Gen Stat", list(ngs_stat_cols.keys()))
             stat_column = ngs_stat_cols[sub_category_key]
             display_cols = ['player_display_name', stat_column]
             groupby_cols = ['player_display_name']
+            leader_labels = NGS_LEADER_LABELS
 
         if stat_column in df_for_leaders.columns and not df_for_leaders.empty:
             aggregation = {'sum' if 'avg' not in stat_column else 'mean'}
-            leaderboard = df_for_leaders.groupby(groupby_cols)[stat_column].sum().reset_index()
-            leaderboard = leaderboard.sort_values(by=stat_column, ascending=False).head(20).reset_index(drop=True)
-            leaderboard.index = leaderboard.index + 1
-            st.dataframe(leaderboard[display_cols].rename(columns=COLUMN_RENAME_MAP))
+            leaderboard = df_for_leaders.groupby(groupby_cols, sort=False, observed=True, as_index=False)[stat_column].sum().nlargest(20, stat_column)
+            leaderboard.index = pd.RangeIndex(1, len(leaderboard) + 1)
+            st.dataframe(leaderboard[display_cols].set_axis([*leader_labels, sub_category_key], axis=1))
             chart_df = leaderboard
             chart_stat_col = stat_column
             chart_title = f"Top 20 Leaders: {sub_category_key} (Weeks {week_range[0]}-{week_range[1]})"
@@ -205,23 +306,21 @@ with tab2:
 
     if player_name:
         st.subheader(f"Stats for {player_name} - {selected_year} {season_type_toggle}")
-        player_weekly_stats = weekly_df[weekly_df['player_display_name'] == player_name].copy()
+        player_weekly_stats = player_weekly_index(selected_year, season_type_toggle).loc[[player_name]]
         
-        cols_with_data = [
-            col for col in OFFENSE_STATS.values() 
-            if col in player_weekly_stats.columns and player_weekly_stats[col].sum() > 0
-        ]
+        stat_sums = player_weekly_stats[OFFENSE_STAT_COLUMNS.intersection(player_weekly_stats.columns, sort=False)].sum()
+        cols_with_data = stat_sums.index[stat_sums > 0]
         
         st.write("**Full Season Aggregate Stats**")
-        if cols_with_data:
-            agg_stats = player_weekly_stats[cols_with_data].sum().astype(int)
+        if not cols_with_data.empty:
+            agg_stats = stat_sums[cols_with_data].astype(int)
             agg_stats_df = agg_stats.rename(COLUMN_RENAME_MAP).reset_index()
             agg_stats_df.columns = ['Statistic', 'Value']
             st.table(agg_stats_df)
         else:
             st.info("This player has no recorded stats for the selected season/type.")
 
-        if cols_with_data:
+        if not cols_with_data.empty:
             st.write("---")
             st.write("**Filter Stats by Week Range**")
             player_min_week, player_max_week = int(player_weekly_stats['week'].min()), int(player_weekly_stats['week'].max())
@@ -242,13 +341,12 @@ with tab2:
             st.write("---")
             
             st.write("**Per-Game Stats**")
-            per_game_cols_to_show = ['week'] + cols_with_data
-            st.dataframe(player_weekly_stats[per_game_cols_to_show].set_index('week').rename(columns=COLUMN_RENAME_MAP))
+            per_game_cols_to_show = ['week', *cols_with_data]
+            st.dataframe(player_weekly_stats[per_game_cols_to_show].set_index('week').set_axis(OFFENSE_STAT_LABELS[cols_with_data], axis=1))
             
             st.write("**Performance Chart**")
-            chart_options = {k: v for k, v in OFFENSE_STATS.items() if v in cols_with_data}
-            chart_stat_key = st.selectbox("Select Stat to Visualize", list(chart_options.keys()))
-            chart_stat_col = chart_options.get(chart_stat_key)
+            chart_stat_key = st.selectbox("Select Stat to Visualize", OFFENSE_STAT_LABELS[cols_with_data].tolist())
+            chart_stat_col = OFFENSE_STATS.get(chart_stat_key)
 
             if chart_stat_col:
                 fig = px.line(player_weekly_stats, x='week', y=chart_stat_col, title=f"Weekly {chart_stat_key}", markers=True)